@@ -20,15 +20,48 @@ Requirements satisfied:
 
 Usage:
   sudo python3 install_jenkins_puppet.py
+  sudo PUPPET_MODULES_TARBALL=<path-or-url> python3 install_jenkins_puppet.py
+  sudo NO_COLOR=1 python3 install_jenkins_puppet.py   # plain output (automatic when piped)
 
 Author: Luis Zambrano
 """
 
+import asyncio
+import glob
+import json
 import os
 import sys
+import shlex
+import shutil
 import subprocess
+import time
+import http.client
+import urllib.error
 import urllib.request
 
+# ─── ENVIRONMENT ──────────────────────────────────────────────────────────────
+
+# Problems found while reading settings at import; main() logs them after the header
+_env_warnings = []
+
+def env_seconds(name, default):
+    """
+    Return environment variable name as whole seconds, or default if unset.
+    An invalid value (e.g. "1h") falls back to default and queues a warning
+    rather than killing the script with a traceback at import time.
+    """
+    raw = os.environ.get(name)
+    if raw is None:
+        return default
+    try:
+        value = int(raw)
+    except ValueError:
+        value = -1
+    if value >= 0:
+        return value
+    _env_warnings.append(f"{name}={raw!r} is not a whole number of seconds — using {default}")
+    return default
+
 # ─── CONSTANTS ────────────────────────────────────────────────────────────────
 
 PUPPET_REPO_URL    = "https://apt.puppet.com/puppet8-release-jammy.deb"
@@ -36,8 +69,28 @@ PUPPET_REPO_DEB    = "/tmp/puppet-release.deb"
 PUPPET_BIN         = "/opt/puppetlabs/bin/puppet"
 PUPPET_MODULE      = "puppetlabs-apt"
 PUPPET_MODULE_VER  = "11.2.0"  # Compatible with Puppet 8
+PUPPET_MODULE_DIR  = "/etc/puppetlabs/code/modules"
+PUPPET_SOURCES     = "/etc/apt/sources.list.d/puppet*.list"
+# Optional pre-built tarball (path or URL) of the modules directory, skips the Forge
+PUPPET_MODULES_TARBALL = os.environ.get("PUPPET_MODULES_TARBALL", "")
 MANIFEST_URL       = "https://raw.githubusercontent.com/zambrano-luis/jenkins-automation/main/track1-puppet/manifests/jenkins-linux.pp"
 MANIFEST_PATH      = "/tmp/jenkins.pp"
+PUPPET_REPO_HOST   = "apt.puppet.com"
+APT_LISTS_DIR      = "/var/lib/apt/lists"
+# Touched after every successful full apt-get update
+APT_UPDATE_STAMP   = "/var/lib/apt/periodic/jenkins-automation-update-stamp"
+APT_UPDATE_TTL     = env_seconds("APT_UPDATE_TTL", 3600)
+# Shared apt options: no translation files on update; no recommends on install
+APT_UPDATE_OPTS    = ["-o", "Acquire::Languages=none"]
+APT_INSTALL_OPTS   = ["--no-install-recommends", "-o", "Dpkg::Use-Pty=0"]
+
+# Paths fetched by prefetch_downloads() during this run -> True if (re)written
+_prefetched = {}
+
+# One opener for every HTTP(S) fetch in this script, so handlers and headers
+# are configured in a single place
+_http = urllib.request.build_opener()
+_http.addheaders = [("User-Agent", "jenkins-automation/track1")]
 
 # ─── LOGGING ──────────────────────────────────────────────────────────────────
 
@@ -50,6 +103,11 @@ class Color:
     CYAN   = "\033[36m"
     MUTED  = "\033[90m"
 
+# No ANSI escapes when output goes to a CI log or file, or NO_COLOR is set
+if os.environ.get("NO_COLOR") or not sys.stdout.isatty():
+    for _name in [n for n in vars(Color) if n.isupper()]:
+        setattr(Color, _name, "")
+
 def log_step(msg):
     print(f"\n{Color.BOLD}{Color.AMBER}==>{Color.RESET} {Color.BOLD}{msg}{Color.RESET}")
 
@@ -65,30 +123,55 @@ def log_ok(msg):
 def log_error(msg):
     print(f"\n{Color.RED}{Color.BOLD}✗  ERROR: {msg}{Color.RESET}\n", file=sys.stderr)
 
-def log_header():
-    print(f"""
+# Banners are formatted once at import, after colour detection
+HEADER_BANNER = f"""
 {Color.BOLD}{Color.AMBER}╔══════════════════════════════════════════════════╗
 ║   Jenkins Automation — Track 1B: Puppet Linux   ║
 ║   Target: Ubuntu 22.04 LTS                      ║
 ║   Port:   8000                                   ║
-╚══════════════════════════════════════════════════╝{Color.RESET}
-""")
+╚══════════════════════════════════════════════════╝{Color.RESET}\n
+"""
+
+def log_header():
+    sys.stdout.write(HEADER_BANNER)
 
 # ─── HELPERS ──────────────────────────────────────────────────────────────────
 
-def run(cmd, check=True):
-    """Run a shell command, stream output, raise on failure."""
+def run(cmd, check=True, stream=True):
+    """
+    Run a command, log its output, exit on failure.
+    cmd is an argv list (as every call site passes) or a string split with
+    shlex — no /bin/sh is spawned.
+    With stream=True (default) output is logged line by line as it arrives and
+    not kept in memory; pass stream=False for short status commands whose
+    stdout the caller needs.
+    """
+    args = shlex.split(cmd) if isinstance(cmd, str) else cmd
     env = os.environ.copy()
     env["DEBIAN_FRONTEND"] = "noninteractive"
-    result = subprocess.run(
-        cmd, shell=True, env=env,
-        stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True
-    )
-    if result.stdout.strip():
-        for line in result.stdout.strip().splitlines():
-            log_info(line)
+    try:
+        if stream:
+            with subprocess.Popen(
+                args, env=env, bufsize=1,
+                stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True
+            ) as proc:
+                for line in proc.stdout:
+                    if line.strip():
+                        log_info(line.rstrip())
+            result = subprocess.CompletedProcess(args, proc.returncode, stdout="")
+        else:
+            result = subprocess.run(
+                args, env=env,
+                stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True
+            )
+            if result.stdout.strip():
+                for line in result.stdout.strip().splitlines():
+                    log_info(line)
+    except FileNotFoundError:
+        # Same exit code a shell would give for a missing binary
+        result = subprocess.CompletedProcess(args, 127, stdout="")
     if check and result.returncode != 0:
-        log_error(f"Command failed (exit {result.returncode}): {cmd}")
+        log_error(f"Command failed (exit {result.returncode}): {shlex.join(args)}")
         sys.exit(result.returncode)
     return result
 
@@ -97,13 +180,165 @@ def ensure_root():
         log_error("This script must be run as root. Use: sudo python3 install_jenkins_puppet.py")
         sys.exit(1)
 
+def check_content_length(response, received):
+    """Raise ContentTooShortError if fewer bytes arrived than Content-Length declared."""
+    expected = response.headers.get("Content-Length", "")
+    if expected.isdecimal() and received < int(expected):
+        raise urllib.error.ContentTooShortError(
+            f"retrieval incomplete: got only {received} out of {expected} bytes", None
+        )
+
+def download(url, path, retries=3, use_etag=False, fatal=True):
+    """
+    Download url to path in-process, retrying transient failures with backoff.
+    Streams straight to disk — no curl, shell, or tee processes involved.
+    With use_etag, the ETag is kept in a sidecar file and the next run sends
+    If-None-Match; a 304 leaves the file untouched and transfers no body.
+    The body lands in <path>.part and is moved into place only once complete,
+    and the ETag is saved only after that, so a truncated transfer can never
+    be pinned by later 304s.
+    Returns True if the file was written, False if it was not modified.
+    A body shorter than its Content-Length counts as a failure; 4xx responses
+    fail at once without retrying. When the last retry fails, logs and exits — or, with fatal=False, raises
+    the error so a worker thread can hand it back to the main thread.
+    """
+    etag_path = f"{path}.etag"
+    part_path = f"{path}.part"
+    headers = {}
+    if use_etag and os.path.isfile(path) and os.path.isfile(etag_path):
+        with open(etag_path) as f:
+            headers["If-None-Match"] = f.read().strip()
+    request = urllib.request.Request(url, headers=headers)
+    for attempt in range(1, retries + 1):
+        try:
+            with _http.open(request, timeout=30) as response:
+                # A new body is coming — the old ETag no longer describes what ends up on disk
+                if os.path.exists(etag_path):
+                    os.remove(etag_path)
+                with open(part_path, "wb") as f:
+                    shutil.copyfileobj(response, f)
+                    check_content_length(response, f.tell())
+                etag = response.headers.get("ETag")
+            os.replace(part_path, path)
+            if use_etag and etag:
+                with open(etag_path, "w") as f:
+                    f.write(etag)
+            return True
+        except urllib.error.HTTPError as e:
+            if e.code == 304:
+                return False
+            error = e
+            if 400 <= e.code < 500:
+                break  # client errors are permanent — retrying cannot help
+        except (urllib.error.URLError, OSError, http.client.HTTPException) as e:
+            error = e
+        if os.path.exists(part_path):
+            os.remove(part_path)
+        if attempt < retries:
+            log_info(f"Download failed ({error}) — retrying...")
+            time.sleep(0.3 * 2 ** (attempt - 1))
+    if not fatal:
+        raise error
+    log_error(f"Download failed: {url} ({error})")
+    sys.exit(1)
+
+def apt_update_age():
+    """
+    Return seconds since this script last ran a successful full apt-get update,
+    or None if it never has. List file mtimes cannot answer this: apt stamps
+    them with the mirror's Last-Modified time and leaves them alone on a 304,
+    so they date the mirror's last publish, not this host's last update.
+    """
+    try:
+        return time.time() - os.path.getmtime(APT_UPDATE_STAMP)
+    except OSError:
+        return None
+
+def touch_update_stamp():
+    """Record a successful full apt-get update for apt_update_age()."""
+    os.makedirs(os.path.dirname(APT_UPDATE_STAMP), exist_ok=True)
+    with open(APT_UPDATE_STAMP, "a"):
+        pass
+    os.utime(APT_UPDATE_STAMP)
+
+def apt_update_if_stale(repo_host, max_age=APT_UPDATE_TTL, source_list=None, force=False):
+    """
+    Run apt-get update unless this script's last successful full update is
+    younger than max_age seconds and repo_host is already indexed. Re-runs
+    within the TTL skip the metadata refetch; a newly added repo always
+    triggers an update.
+    When the other lists are fresh and only repo_host is missing or force is
+    set, source_list (a glob of .list files) limits the update to that repo
+    alone. force covers a repo whose host is already indexed but whose
+    source changed, e.g. puppet7 -> puppet8 on the same apt.puppet.com suite.
+    """
+    age = apt_update_age()
+    if age is not None and age < max_age:
+        if not force and glob.glob(f"{APT_LISTS_DIR}/{repo_host}_*Release"):
+            log_skip(f"apt package index for {repo_host} is fresh")
+            return
+        sources = glob.glob(source_list) if source_list else []
+        if sources:
+            # Only this repo is refreshed, so the stamp for the full index is left alone
+            log_info(f"Updating apt package index for {repo_host} only...")
+            for source in sources:
+                run([
+                    "apt-get", "update", "-qq", *APT_UPDATE_OPTS,
+                    "-o", f"Dir::Etc::sourcelist={source}",
+                    "-o", "Dir::Etc::sourceparts=-", "-o", "APT::Get::List-Cleanup=0",
+                ])
+            return
+    log_info("Updating apt package index...")
+    run(["apt-get", "update", "-qq", *APT_UPDATE_OPTS])
+    touch_update_stamp()
+
+async def fetch(url, path):
+    _prefetched[path] = await asyncio.to_thread(
+        download, url, path, use_etag=path == MANIFEST_PATH, fatal=False
+    )
+
+def prefetch_downloads():
+    """
+    Fetch the Puppet release deb and the Jenkins manifest concurrently.
+    Neither depends on the other, so overlapping them costs max() of the two
+    round trips instead of the sum. The release deb is only fetched when
+    Puppet is not installed yet.
+    """
+    downloads = [(MANIFEST_URL, MANIFEST_PATH)]
+    if not os.path.isfile(PUPPET_BIN):
+        downloads.append((PUPPET_REPO_URL, PUPPET_REPO_DEB))
+
+    async def fetch_all():
+        return await asyncio.gather(
+            *(fetch(url, path) for url, path in downloads), return_exceptions=True
+        )
+
+    log_info(f"Prefetching {len(downloads)} download(s) in parallel...")
+    results = asyncio.run(fetch_all())
+    # Workers raise instead of exiting; report every failure, then exit once here
+    failed = [(url, e) for (url, _), e in zip(downloads, results) if isinstance(e, Exception)]
+    for url, error in failed:
+        log_error(f"Download failed: {url} ({error})")
+    if failed:
+        sys.exit(1)
+
 def is_package_installed(package):
-    result = run(f"dpkg-query -W -f='${{Status}}' {package} 2>/dev/null", check=False)
+    result = run(["dpkg-query", "-W", "-f=${Status}", package], check=False, stream=False)
     return "install ok installed" in result.stdout
 
 def puppet_module_installed(module, version):
-    result = run(f"{PUPPET_BIN} module list 2>/dev/null | grep {module}", check=False)
-    return result.returncode == 0 and version in result.stdout
+    # Fast path — read metadata.json directly instead of booting Ruby for `puppet module list`
+    metadata = f"{PUPPET_MODULE_DIR}/{module.split('-', 1)[1]}/metadata.json"
+    try:
+        with open(metadata) as f:
+            if json.load(f).get("version") == version:
+                return True
+    except (OSError, ValueError):
+        # Missing, or empty/half-written by an interrupted install — ask Puppet instead
+        pass
+    # Fallback — module may live elsewhere on a user-configured modulepath
+    result = run([PUPPET_BIN, "module", "list"], check=False, stream=False)
+    return any(module in line and version in line for line in result.stdout.splitlines())
 
 # ─── BOOTSTRAP STEPS ──────────────────────────────────────────────────────────
 
@@ -117,23 +352,25 @@ def step_install_puppet():
 
     if os.path.isfile(PUPPET_BIN):
         # Verify it is Puppet 8 — upgrade if not
-        version_result = run(f"{PUPPET_BIN} --version", check=False)
+        version_result = run([PUPPET_BIN, "--version"], check=False, stream=False)
         if version_result.stdout.strip().startswith("8."):
             log_skip("Puppet 8 already installed")
             return
         else:
             log_info(f"Puppet {version_result.stdout.strip()} detected — upgrading to Puppet 8...")
-            run("apt-get remove -y puppet-agent", check=False)
-            run("rm -rf /etc/puppetlabs/code/modules/apt", check=False)
-            run("rm -rf /etc/puppetlabs/code/modules/stdlib", check=False)
+            run(["apt-get", "remove", "-y", "puppet-agent"], check=False)
+            shutil.rmtree(f"{PUPPET_MODULE_DIR}/apt", ignore_errors=True)
+            shutil.rmtree(f"{PUPPET_MODULE_DIR}/stdlib", ignore_errors=True)
 
     log_info("Adding Puppet apt repository...")
-    urllib.request.urlretrieve(PUPPET_REPO_URL, PUPPET_REPO_DEB)
-    run(f"dpkg -i {PUPPET_REPO_DEB}")
-    run("apt-get update -qq")
+    if PUPPET_REPO_DEB not in _prefetched:
+        download(PUPPET_REPO_URL, PUPPET_REPO_DEB)
+    run(["dpkg", "-i", PUPPET_REPO_DEB])
+    # The release deb was just (re)installed, so its source may differ from the indexed one
+    apt_update_if_stale(PUPPET_REPO_HOST, source_list=PUPPET_SOURCES, force=True)
 
     log_info("Installing puppet-agent from Puppet 8 repo...")
-    run("apt-get install -y -qq puppet-agent")
+    run(["apt-get", "install", "-y", "-qq", *APT_INSTALL_OPTS, "puppet-agent"])
     log_ok("Puppet agent installed")
 
     # Add Puppet binaries to PATH for this session
@@ -151,21 +388,39 @@ def step_install_module():
         log_skip(f"{PUPPET_MODULE} already installed")
         return
 
-    log_info(f"Installing {PUPPET_MODULE}...")
-    run(f"{PUPPET_BIN} module install {PUPPET_MODULE} --target-dir /etc/puppetlabs/code/modules")
+    if PUPPET_MODULES_TARBALL:
+        # Pre-cached modules: one tar extract instead of a Forge fetch + dependency resolve
+        log_info(f"Extracting pre-cached modules from {PUPPET_MODULES_TARBALL}...")
+        tarball = PUPPET_MODULES_TARBALL
+        if "://" in tarball:
+            tarball = "/tmp/puppet-modules.tar.gz"
+            download(PUPPET_MODULES_TARBALL, tarball)
+        os.makedirs(PUPPET_MODULE_DIR, exist_ok=True)
+        run(["tar", "-xzf", tarball, "-C", PUPPET_MODULE_DIR])
+    else:
+        log_info(f"Installing {PUPPET_MODULE}...")
+        run([PUPPET_BIN, "module", "install", PUPPET_MODULE, "--target-dir", PUPPET_MODULE_DIR])
     log_ok(f"{PUPPET_MODULE} installed")
 
 
 def step_download_manifest():
     """
     Step 3 — Download the Jenkins Puppet manifest from GitHub.
-    Always downloads fresh to ensure latest version is applied.
+    Revalidated on every run with a conditional GET (If-None-Match) so the
+    latest version is applied without re-transferring an unchanged file.
     """
     log_step("Step 3/4 — Downloading Jenkins manifest")
 
-    log_info(f"Fetching manifest from GitHub...")
-    urllib.request.urlretrieve(MANIFEST_URL, MANIFEST_PATH)
-    log_ok(f"Manifest saved to {MANIFEST_PATH}")
+    if MANIFEST_PATH in _prefetched:
+        changed = _prefetched[MANIFEST_PATH]
+    else:
+        log_info(f"Fetching manifest from GitHub...")
+        changed = download(MANIFEST_URL, MANIFEST_PATH, use_etag=True)
+
+    if changed:
+        log_ok(f"Manifest saved to {MANIFEST_PATH}")
+    else:
+        log_skip(f"Manifest at {MANIFEST_PATH} is unchanged upstream (HTTP 304)")
 
 
 def step_puppet_apply():
@@ -179,8 +434,7 @@ def step_puppet_apply():
 
     log_info("Running puppet apply (this may take a few minutes)...")
     result = run(
-        f"{PUPPET_BIN} apply {MANIFEST_PATH} "
-        f"--modulepath /etc/puppetlabs/code/modules",
+        [PUPPET_BIN, "apply", MANIFEST_PATH, "--modulepath", PUPPET_MODULE_DIR],
         check=False
     )
 
@@ -198,8 +452,7 @@ def step_puppet_apply():
 
 # ─── SUMMARY ──────────────────────────────────────────────────────────────────
 
-def log_summary():
-    print(f"""
+SUMMARY_BANNER = f"""
 {Color.BOLD}{Color.GREEN}╔══════════════════════════════════════════════════╗
 ║              Installation Complete               ║
 ╠══════════════════════════════════════════════════╣
@@ -208,15 +461,21 @@ def log_summary():
 ║  Access:  http://<your-ip>:8000              ║
 ║  Logs:    journalctl -u jenkins -f               ║
 ║  Puppet:  puppet apply manifests/jenkins.pp      ║
-╚══════════════════════════════════════════════════╝{Color.RESET}
-""")
+╚══════════════════════════════════════════════════╝{Color.RESET}\n
+"""
+
+def log_summary():
+    sys.stdout.write(SUMMARY_BANNER)
 
 
 # ─── MAIN ─────────────────────────────────────────────────────────────────────
 
 def main():
     log_header()
+    for warning in _env_warnings:
+        log_info(warning)
     ensure_root()
+    prefetch_downloads()
 
     step_install_puppet()
     step_install_module()
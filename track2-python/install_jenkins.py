@@ -12,15 +12,55 @@ Requirements satisfied:
 
 Usage:
   sudo python3 install_jenkins.py
+  sudo USE_APT_FAST=1 python3 install_jenkins.py   # parallel downloads via apt-fast
+  sudo APT_CACHE_DIR=/cache/apt python3 install_jenkins.py   # persistent apt cache
+  sudo APT_UPDATE_TTL=0 python3 install_jenkins.py   # always refresh apt lists
+  sudo NO_COLOR=1 python3 install_jenkins.py   # plain output (automatic when piped)
 
 Author: Luis Zambrano
 """
 
+import asyncio
+import base64
+import glob
+import hashlib
 import os
+import re
 import sys
+import shlex
+import shutil
 import subprocess
 import platform
+import tempfile
+import time
+import http.client
+# urllib.request pulls in ssl and email — importing it here at load time
+# keeps that cost off the first download
 import urllib.error
+import urllib.request
+
+# ─── ENVIRONMENT ──────────────────────────────────────────────────────────────
+
+# Problems found while reading settings at import; main() logs them after the header
+_env_warnings = []
+
+def env_seconds(name, default):
+    """
+    Return environment variable name as whole seconds, or default if unset.
+    An invalid value (e.g. "1h") falls back to default and queues a warning
+    rather than killing the script with a traceback at import time.
+    """
+    raw = os.environ.get(name)
+    if raw is None:
+        return default
+    try:
+        value = int(raw)
+    except ValueError:
+        value = -1
+    if value >= 0:
+        return value
+    _env_warnings.append(f"{name}={raw!r} is not a whole number of seconds — using {default}")
+    return default
 
 # ─── CONSTANTS ────────────────────────────────────────────────────────────────
 
@@ -28,11 +68,66 @@ JENKINS_PORT       = "8000"
 JENKINS_CONFIG     = "/etc/default/jenkins"
 JENKINS_HOME       = "/var/lib/jenkins"
 JENKINS_KEYRING    = "/usr/share/keyrings/jenkins-keyring.asc"
+JENKINS_KEY_TMP    = f"{JENKINS_KEYRING}.tmp"  # download lands here, verified before swap-in
 JENKINS_REPO_FILE  = "/etc/apt/sources.list.d/jenkins.list"
 JENKINS_KEY_URL    = "https://pkg.jenkins.io/debian-stable/jenkins.io-2026.key"
 JENKINS_REPO_LINE  = "deb [signed-by=/usr/share/keyrings/jenkins-keyring.asc] https://pkg.jenkins.io/debian-stable binary/"
-JAVA_PACKAGE       = "openjdk-17-jdk"
+JENKINS_REPO_HOST  = "pkg.jenkins.io"
+JAVA_PACKAGE       = "openjdk-17-jdk-headless"  # no X11/fonts/docs — Jenkins runs headless
 JENKINS_PACKAGE    = "jenkins"
+REQUIRED_PACKAGES  = (JAVA_PACKAGE, JENKINS_PACKAGE)  # installed together in one apt transaction
+# A file each package ships, checked before falling back to the dpkg database
+_INSTALL_MARKERS   = {
+    JENKINS_PACKAGE: "/usr/share/jenkins/jenkins.war",
+    JAVA_PACKAGE:    "/usr/lib/jvm/java-17-openjdk-*/bin/javac",
+}
+# Shared apt options so every update and install call site stays in sync:
+# no translation files on update; no recommends and no pty on install
+APT_UPDATE_OPTS    = ["-o", "Acquire::Languages=none"]
+APT_INSTALL_OPTS   = ["--no-install-recommends", "-o", "Dpkg::Use-Pty=0"]
+APT_COMMANDS       = ("apt-get", "apt-fast")
+APT_CACHE_DIR      = os.environ.get("APT_CACHE_DIR", "")
+APT_KEEP_DEBS_CONF = "/etc/apt/apt.conf.d/01keep-debs"
+APT_LISTS_DIR      = f"{APT_CACHE_DIR}/lists" if APT_CACHE_DIR else "/var/lib/apt/lists"
+# Touched after every successful apt-get update; kept beside the lists it describes
+APT_UPDATE_STAMP   = (f"{APT_CACHE_DIR}/update-stamp" if APT_CACHE_DIR
+                      else "/var/lib/apt/periodic/jenkins-automation-update-stamp")
+APT_UPDATE_TTL     = env_seconds("APT_UPDATE_TTL", 3600)
+DPKG_STATUS        = "/var/lib/dpkg/status"
+UNIT_PROPERTIES    = "ActiveState,UnitFileState,Environment"
+
+# Parsed dpkg database, loaded on first package check
+_dpkg_status = None
+
+# Set when a systemd drop-in changed on disk; step_enable_and_restart runs
+# the single daemon-reload, so a run never reparses unit files twice
+_pending_daemon_reload = False
+
+# True once precheck_state() has downloaded the Jenkins key to JENKINS_KEY_TMP
+_key_prefetched = False
+
+# Probe results gathered by precheck_state(); cleared by run() after any
+# streamed command, since those are the ones that change system state
+_state = {}
+
+WIZARD_FLAG        = "-Djenkins.install.runSetupWizard=false"
+OVERRIDE_DIR       = "/etc/systemd/system/jenkins.service.d"
+OVERRIDE_FILE      = f"{OVERRIDE_DIR}/override.conf"
+# Written after a successful run; a matching stamp lets re-runs exit early
+STAMP_FILE         = f"{JENKINS_HOME}/.install_jenkins.stamp"
+
+# Compiled once at import — no per-step regex compilation on the hot path
+# Bytes pattern: /etc/default/jenkins is read and rewritten in binary, no decode
+_HTTP_PORT_RE     = re.compile(rb"HTTP_PORT=\d+")
+_HTTP_PORT_LINE   = f"HTTP_PORT={JENKINS_PORT}".encode()
+_OVERRIDE_PORT_RE = re.compile(rf'^Environment="JENKINS_PORT={JENKINS_PORT}"$', re.MULTILINE)
+
+# One opener for every download in this script, so handlers and headers are
+# configured in a single place; step_validate polls over its own keep-alive
+# http.client connection with the same User-Agent
+USER_AGENT = "jenkins-automation/track2"
+_http = urllib.request.build_opener()
+_http.addheaders = [("User-Agent", USER_AGENT)]
 
 # ─── LOGGING ──────────────────────────────────────────────────────────────────
 
@@ -45,11 +140,19 @@ class Color:
     CYAN   = "\033[36m"
     MUTED  = "\033[90m"
 
+# No ANSI escapes when output goes to a CI log or file, or NO_COLOR is set
+if os.environ.get("NO_COLOR") or not sys.stdout.isatty():
+    for _name in [n for n in vars(Color) if n.isupper()]:
+        setattr(Color, _name, "")
+
+# Built once; run() writes it in front of every relayed output line
+INFO_PREFIX = f"    {Color.MUTED}→{Color.RESET}  "
+
 def log_step(msg):
     print(f"\n{Color.BOLD}{Color.AMBER}==>{Color.RESET} {Color.BOLD}{msg}{Color.RESET}")
 
 def log_info(msg):
-    print(f"    {Color.MUTED}→{Color.RESET}  {msg}")
+    print(f"{INFO_PREFIX}{msg}")
 
 def log_skip(msg):
     print(f"    {Color.CYAN}↷  SKIP:{Color.RESET} {msg} — already done")
@@ -60,49 +163,363 @@ def log_ok(msg):
 def log_error(msg):
     print(f"\n{Color.RED}{Color.BOLD}✗  ERROR: {msg}{Color.RESET}\n", file=sys.stderr)
 
-def log_header():
-    print(f"""
+# Banners are formatted once at import, after colour detection
+HEADER_BANNER = f"""
 {Color.BOLD}{Color.AMBER}╔══════════════════════════════════════════════════╗
 ║     Jenkins Automation — Track 2: Pure Python    ║
 ║     Target: Ubuntu 22.04 LTS                     ║
 ║     Port:   {JENKINS_PORT}                                   ║
-╚══════════════════════════════════════════════════╝{Color.RESET}
-""")
+╚══════════════════════════════════════════════════╝{Color.RESET}\n
+"""
+
+def log_header():
+    sys.stdout.write(HEADER_BANNER)
 
 # ─── HELPERS ──────────────────────────────────────────────────────────────────
 
-def run(cmd, env_extra=None, check=True):
-    """Run a shell command, stream output, raise on failure."""
+def run(cmd, env_extra=None, check=True, stream=True):
+    """
+    Run a command, log its output, exit on failure.
+    cmd is an argv list (as every call site passes) or a string split with
+    shlex — no /bin/sh is spawned, so subprocess can take its posix_spawn
+    fast path.
+    With stream=True (default) output is logged line by line as it arrives and
+    not kept in memory; pass stream=False for short read-only status commands
+    whose stdout the caller needs. Streamed commands invalidate cached state.
+    apt-get/apt-fast commands get the APT_CACHE_DIR options spliced in, so
+    no call site can forget them.
+    """
+    args = shlex.split(cmd) if isinstance(cmd, str) else cmd
+    if os.path.basename(args[0]) in APT_COMMANDS:
+        args = [args[0], *apt_cache_opts(), *args[1:]]
     env = os.environ.copy()
     env["DEBIAN_FRONTEND"] = "noninteractive"
     if env_extra:
         env.update(env_extra)
-    result = subprocess.run(
-        cmd, shell=True, env=env,
-        stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True
-    )
-    if result.stdout.strip():
-        for line in result.stdout.strip().splitlines():
-            log_info(line)
+    try:
+        if stream:
+            with subprocess.Popen(
+                args, env=env, bufsize=1,
+                stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True
+            ) as proc:
+                relay_output(proc.stdout)
+            result = subprocess.CompletedProcess(args, proc.returncode, stdout="")
+            invalidate_state(args)
+        else:
+            result = subprocess.run(
+                args, env=env,
+                stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True
+            )
+            relay_output(result.stdout.splitlines(keepends=True))
+    except FileNotFoundError:
+        # Same exit code a shell would give for a missing binary
+        result = subprocess.CompletedProcess(args, 127, stdout="")
     if check and result.returncode != 0:
-        log_error(f"Command failed (exit {result.returncode}): {cmd}")
+        log_error(f"Command failed (exit {result.returncode}): {shlex.join(args)}")
         sys.exit(result.returncode)
     return result
 
+def relay_output(lines):
+    """
+    Write command output lines behind INFO_PREFIX, skipping blank ones.
+    Goes straight to sys.stdout.write with the prefix built once, rather
+    than a print() and f-string per line of chatty apt output.
+    """
+    write = sys.stdout.write
+    for line in lines:
+        if not line.isspace():
+            write(INFO_PREFIX + line if line.endswith("\n") else f"{INFO_PREFIX}{line}\n")
+
+def invalidate_state(args):
+    """Drop cached state after a command that may have changed it."""
+    global _dpkg_status
+    _state.clear()
+    if os.path.basename(args[0]) in (*APT_COMMANDS, "dpkg"):
+        _dpkg_status = None
+
+def load_dpkg_status():
+    """
+    Parse /var/lib/dpkg/status once into {package: status}.
+    Reading the dpkg database directly avoids a dpkg-query fork per check;
+    the cache is reloaded after run() executes a package manager command.
+    """
+    global _dpkg_status
+    if _dpkg_status is None:
+        _dpkg_status = {}
+        if os.path.isfile(DPKG_STATUS):
+            with open(DPKG_STATUS, encoding="utf-8", errors="replace") as f:
+                package = None
+                for line in f:
+                    if line.startswith("Package: "):
+                        package = line[9:].strip()
+                    elif line.startswith("Status: ") and package:
+                        _dpkg_status[package] = line[8:].strip()
+    return _dpkg_status
+
 def is_package_installed(package):
-    """Return True if a deb package is installed."""
-    result = run(f"dpkg-query -W -f='${{Status}}' {package} 2>/dev/null", check=False)
-    return "install ok installed" in result.stdout
+    """Return True if a deb package is installed (not removed or config-files only)."""
+    return load_dpkg_status().get(package) == "install ok installed"
+
+def is_installed_fast(package):
+    """
+    Return True if package is installed, checking its marker file first.
+    A hit costs one stat instead of parsing /var/lib/dpkg/status; a miss
+    (or a package without a marker) falls through to is_package_installed.
+    The answer is cached in _state until run() executes a package command.
+    """
+    key = f"installed:{package}"
+    if key not in _state:
+        marker = _INSTALL_MARKERS.get(package)
+        _state[key] = bool(marker and glob.glob(marker)) or is_package_installed(package)
+    return _state[key]
+
+def parse_unit_state(output):
+    """Parse KEY=VALUE lines from `systemctl show` into a dict."""
+    return dict(line.partition("=")[::2] for line in output.splitlines() if "=" in line)
+
+def unit_state(service):
+    """
+    Return ActiveState, UnitFileState and Environment for a systemd unit.
+    One `systemctl show` answers all three, cached until run() executes a
+    state-changing command (enable, restart, daemon-reload, apt).
+    """
+    key = f"unit:{service}"
+    if key not in _state:
+        result = run(
+            ["systemctl", "show", service, f"--property={UNIT_PROPERTIES}"],
+            check=False, stream=False
+        )
+        _state[key] = parse_unit_state(result.stdout)
+    return _state[key]
 
 def service_is_active(service):
     """Return True if a systemd service is active."""
-    result = run(f"systemctl is-active {service}", check=False)
-    return result.stdout.strip() == "active"
+    return unit_state(service).get("ActiveState") == "active"
 
 def service_is_enabled(service):
     """Return True if a systemd service is enabled."""
-    result = run(f"systemctl is-enabled {service}", check=False)
-    return result.stdout.strip() == "enabled"
+    return unit_state(service).get("UnitFileState") == "enabled"
+
+def jenkins_listening():
+    """Return True if a socket is listening on JENKINS_PORT."""
+    if "port_ok" in _state:
+        return _state["port_ok"]
+    result = run(["ss", "-Htln", f"sport = :{JENKINS_PORT}"], check=False, stream=False)
+    return result.returncode == 0 and bool(result.stdout.strip())
+
+def crc24(data):
+    """OpenPGP CRC-24 (RFC 4880 §6.1) used by the ASCII armor checksum line."""
+    crc = 0xB704CE
+    for byte in data:
+        crc ^= byte << 16
+        for _ in range(8):
+            crc <<= 1
+            if crc & 0x1000000:
+                crc ^= 0x1864CFB
+    return crc & 0xFFFFFF
+
+def dearmor(armored):
+    """
+    Decode an ASCII-armored OpenPGP block to binary, in-process — no gpg.
+    Verifies the CRC-24 checksum when present. Raises ValueError if the armor
+    is missing, truncated, or corrupt (e.g. an HTML error page was saved).
+    """
+    lines = [line.strip() for line in armored.decode("ascii").splitlines()]
+    begin = next((i for i, l in enumerate(lines) if l.startswith("-----BEGIN PGP")), None)
+    end   = next((i for i, l in enumerate(lines) if l.startswith("-----END PGP")), None)
+    if begin is None or end is None or end <= begin:
+        raise ValueError("missing armor header or footer")
+    body = lines[begin + 1:end]
+    # Armor headers (Version:, Comment:) end at the first blank line
+    if "" in body:
+        body = body[body.index("") + 1:]
+    checksum = None
+    if body and body[-1].startswith("="):
+        checksum = base64.b64decode(body.pop()[1:])
+    data = base64.b64decode("".join(body), validate=True)
+    if not data:
+        raise ValueError("empty armor body")
+    if checksum is not None and checksum != crc24(data).to_bytes(3, "big"):
+        raise ValueError("armor checksum mismatch")
+    return data
+
+def jenkins_key_valid():
+    """Return True if the keyring exists and holds a complete, uncorrupted armored key."""
+    if not os.path.isfile(JENKINS_KEYRING):
+        return False
+    with open(JENKINS_KEYRING, "rb") as f:
+        armored = f.read()
+    try:
+        dearmor(armored)
+    except ValueError:
+        return False
+    return True
+
+async def probe(*args):
+    """Run a read-only command asynchronously, return (exit code, stripped stdout)."""
+    try:
+        proc = await asyncio.create_subprocess_exec(
+            *args, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL
+        )
+    except OSError:
+        # Missing or not executable — report it like a shell would, as a failed probe
+        return 127, ""
+    stdout, _ = await proc.communicate()
+    return proc.returncode, stdout.decode().strip()
+
+async def gather_probes(fetch_key=False):
+    jobs = [
+        probe("systemctl", "show", JENKINS_PACKAGE, f"--property={UNIT_PROPERTIES}"),
+        probe("ss", "-Htln", f"sport = :{JENKINS_PORT}"),
+    ]
+    if fetch_key:
+        jobs.append(asyncio.to_thread(download, JENKINS_KEY_URL, JENKINS_KEY_TMP, fatal=False))
+    return await asyncio.gather(*jobs, return_exceptions=True)
+
+def precheck_state():
+    """
+    Gather current state once, up front, before any step runs.
+    The systemctl and ss probes run concurrently, so an idempotent re-run
+    pays for the slowest probe instead of the sum; the rest are file reads.
+    When the Jenkins key is missing or invalid its download rides along in a
+    worker thread, so the TLS round trip overlaps the probes instead of
+    stalling step 1.
+    Steps read the cached results until a state-changing command clears them.
+    """
+    global _key_prefetched
+    _state["key_valid"] = jenkins_key_valid()
+    (_, unit), (port_rc, listeners), *fetched = asyncio.run(
+        gather_probes(fetch_key=not _state["key_valid"])
+    )
+    # The key download raises instead of exiting in its worker; exit here
+    if fetched and isinstance(fetched[0], Exception):
+        log_error(f"Download failed: {JENKINS_KEY_URL} ({fetched[0]})")
+        sys.exit(1)
+    _key_prefetched = not _state["key_valid"]
+    _state[f"unit:{JENKINS_PACKAGE}"] = parse_unit_state(unit)
+    _state["port_ok"]   = port_rc == 0 and bool(listeners)
+    summary = {
+        "java":              is_installed_fast(JAVA_PACKAGE),
+        "jenkins_installed": is_installed_fast(JENKINS_PACKAGE),
+        "jenkins_active":    service_is_active(JENKINS_PACKAGE),
+        "jenkins_enabled":   service_is_enabled(JENKINS_PACKAGE),
+        "key_valid":         _state["key_valid"],
+        "port_ok":           _state["port_ok"],
+    }
+    log_info("Current state: " + ", ".join(f"{k}={'yes' if v else 'no'}" for k, v in summary.items()))
+
+def apt_installer():
+    """
+    Return the apt front-end used for package installs.
+    apt-fast splits each .deb across parallel connections and mirrors, which
+    helps on the ~150MB JDK download. Opt-in via USE_APT_FAST; falls back to
+    apt-get when apt-fast is not installed.
+    """
+    if os.environ.get("USE_APT_FAST"):
+        if shutil.which("apt-fast"):
+            return "apt-fast"
+        log_info("USE_APT_FAST is set but apt-fast is not installed — using apt-get")
+    return "apt-get"
+
+def apt_cache_opts():
+    """Return apt options pointing archives and lists at APT_CACHE_DIR, or [] if unset."""
+    if not APT_CACHE_DIR:
+        return []
+    return [
+        "-o", f"Dir::Cache::Archives={APT_CACHE_DIR}/archives",
+        "-o", f"Dir::State::Lists={APT_CACHE_DIR}/lists",
+    ]
+
+def setup_apt_cache():
+    """
+    Prepare a persistent apt cache when APT_CACHE_DIR is set.
+    CI users mount a volume at APT_CACHE_DIR so package lists and downloaded
+    .deb files survive between runs — the same idea as sharing a Maven or npm
+    cache. No-op when the variable is unset.
+    """
+    if not APT_CACHE_DIR:
+        return
+    log_info(f"Using persistent apt cache at {APT_CACHE_DIR}")
+    # apt refuses to run without the partial/ download directories
+    os.makedirs(f"{APT_CACHE_DIR}/archives/partial", exist_ok=True)
+    os.makedirs(f"{APT_CACHE_DIR}/lists/partial", exist_ok=True)
+    if not os.path.isfile(APT_KEEP_DEBS_CONF):
+        with open(APT_KEEP_DEBS_CONF, "w") as f:
+            f.write('Binary::apt::APT::Keep-Downloaded-Packages "true";\n')
+
+def check_content_length(response, received):
+    """Raise ContentTooShortError if fewer bytes arrived than Content-Length declared."""
+    expected = response.headers.get("Content-Length", "")
+    if expected.isdecimal() and received < int(expected):
+        raise urllib.error.ContentTooShortError(
+            f"retrieval incomplete: got only {received} out of {expected} bytes", None
+        )
+
+def download(url, path, retries=3, fatal=True):
+    """
+    Download url to path in-process, retrying transient failures with backoff.
+    Streams straight to disk — no curl, shell, or tee processes involved.
+    A body shorter than its Content-Length counts as a failure; 4xx responses
+    fail at once without retrying. When the last retry fails, logs and exits — or, with fatal=False, raises
+    the error so a worker thread can hand it back to the main thread.
+    """
+    for attempt in range(1, retries + 1):
+        try:
+            with _http.open(url, timeout=30) as response, open(path, "wb") as f:
+                shutil.copyfileobj(response, f)
+                check_content_length(response, f.tell())
+            return
+        except urllib.error.HTTPError as e:
+            error = e
+            if 400 <= e.code < 500:
+                break  # client errors are permanent — retrying cannot help
+        except (urllib.error.URLError, OSError, http.client.HTTPException) as e:
+            error = e
+        if attempt < retries:
+            log_info(f"Download failed ({error}) — retrying...")
+            time.sleep(0.3 * 2 ** (attempt - 1))
+    if not fatal:
+        raise error
+    log_error(f"Download failed: {url} ({error})")
+    sys.exit(1)
+
+def apt_update_age():
+    """
+    Return seconds since this script last ran a successful full apt-get update,
+    or None if it never has. List file mtimes cannot answer this: apt stamps
+    them with the mirror's Last-Modified time and leaves them alone on a 304,
+    so they date the mirror's last publish, not this host's last update.
+    """
+    try:
+        return time.time() - os.path.getmtime(APT_UPDATE_STAMP)
+    except OSError:
+        return None
+
+def touch_update_stamp():
+    """Record a successful full apt-get update for apt_update_age()."""
+    os.makedirs(os.path.dirname(APT_UPDATE_STAMP), exist_ok=True)
+    with open(APT_UPDATE_STAMP, "a"):
+        pass
+    os.utime(APT_UPDATE_STAMP)
+
+def repo_is_indexed(repo_host):
+    """Return True if apt has a Release/InRelease index for repo_host."""
+    return bool(glob.glob(f"{APT_LISTS_DIR}/{repo_host}_*Release"))
+
+def apt_update_if_stale(repo_host, max_age=APT_UPDATE_TTL, force=False):
+    """
+    Run apt-get update unless this script's last successful update is younger
+    than max_age seconds and repo_host is already indexed. Re-runs within the
+    TTL skip the metadata refetch; a newly added repo, or force, always
+    triggers an update.
+    """
+    age = apt_update_age()
+    if not force and age is not None and age < max_age and repo_is_indexed(repo_host):
+        log_skip(f"apt package index refreshed {int(age)}s ago")
+        return
+    log_info("Updating apt package index...")
+    run(["apt-get", "update", "-qq", *APT_UPDATE_OPTS])
+    touch_update_stamp()
 
 def file_contains(path, text):
     """Return True if file exists and contains the given text."""
@@ -111,6 +528,72 @@ def file_contains(path, text):
     with open(path, "r") as f:
         return text in f.read()
 
+def write_atomic(path, content, mode=0o644):
+    """
+    Replace path with content atomically: write a temp file in the same
+    directory, fsync it, then os.replace() over the target. A crash mid-write
+    leaves either the old file or the new one, never a truncated mix.
+    Keeps the existing file's permissions, or uses mode for a new file.
+    content may be str or bytes.
+    """
+    directory = os.path.dirname(path)
+    file_mode = "wb" if isinstance(content, bytes) else "w"
+    with tempfile.NamedTemporaryFile(file_mode, dir=directory, delete=False) as tmp:
+        tmp.write(content)
+        tmp.flush()
+        os.fsync(tmp.fileno())
+    if os.path.exists(path):
+        shutil.copymode(path, tmp.name)
+    else:
+        os.chmod(tmp.name, mode)
+    os.replace(tmp.name, path)
+    dir_fd = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(dir_fd)
+    finally:
+        os.close(dir_fd)
+
+def set_http_port(content):
+    """Return config bytes with HTTP_PORT set to JENKINS_PORT, appending it if absent."""
+    if _HTTP_PORT_RE.search(content):
+        return _HTTP_PORT_RE.sub(_HTTP_PORT_LINE, content)
+    return content + b"\n" + _HTTP_PORT_LINE + b"\n"
+
+def http_port_is_set():
+    """
+    Return True if every HTTP_PORT= assignment in JENKINS_CONFIG already
+    reads JENKINS_PORT, i.e. set_http_port would leave the file unchanged.
+    Streams the file line by line and stops at the first mismatch, so a
+    re-run never loads the whole config into memory.
+    """
+    has_target = False
+    with open(JENKINS_CONFIG, "rb") as f:
+        for line in f:
+            if b"HTTP_PORT=" not in line:
+                continue
+            for match in _HTTP_PORT_RE.finditer(line):
+                if match.group() != _HTTP_PORT_LINE:
+                    return False
+                has_target = True
+    return has_target
+
+def edit_jenkins_config(mutations):
+    """
+    Apply mutations to JENKINS_CONFIG with one read and at most one atomic write.
+    Each mutation is a pure function taking and returning the file content
+    as bytes.
+    Returns True if the file was rewritten, False if already at desired state.
+    """
+    with open(JENKINS_CONFIG, "rb") as f:
+        content = f.read()
+    updated = content
+    for mutate in mutations:
+        updated = mutate(updated)
+    if updated == content:
+        return False
+    write_atomic(JENKINS_CONFIG, updated)
+    return True
+
 def ensure_root():
     """Exit if not running as root."""
     if os.geteuid() != 0:
@@ -118,45 +601,61 @@ def ensure_root():
         sys.exit(1)
 
 def check_ubuntu():
-    """Warn if not running on Ubuntu 22.04."""
-    if not os.path.isfile("/etc/os-release"):
+    """
+    Exit if not running on Ubuntu; warn if the release is not 22.04.
+    Matches ID= exactly — derivatives such as Pop!_OS mention Ubuntu in
+    UBUNTU_CODENAME but are not Ubuntu. Uses the stdlib os-release parser,
+    which caches its result; a missing os-release file is not fatal.
+    """
+    try:
+        info = platform.freedesktop_os_release()
+    except OSError:
         return
-    with open("/etc/os-release") as f:
-        content = f.read()
-    if "Ubuntu" not in content:
+    os_id, version_id = info.get("ID"), info.get("VERSION_ID")
+    if os_id != "ubuntu":
         log_error("This script is designed for Ubuntu 22.04 LTS. Detected OS may not be compatible.")
         sys.exit(1)
+    if version_id != "22.04":
+        log_info(f"Detected Ubuntu {version_id} — this script is validated on Ubuntu 22.04 LTS")
 
-# ─── INSTALLATION STEPS ───────────────────────────────────────────────────────
-
-def step_install_java():
-    """Step 1 — Install OpenJDK 17. Idempotent: skips entirely if already installed."""
-    log_step("Step 1/7 — Installing OpenJDK 17")
-
-    if is_package_installed(JAVA_PACKAGE):
-        log_skip(f"{JAVA_PACKAGE} is already installed")
-        return
-
-    log_info("Updating apt package index...")
-    run("apt-get update -qq")
-    log_info(f"Installing {JAVA_PACKAGE}...")
-    run(f"apt-get install -y -qq {JAVA_PACKAGE}")
-    log_ok(f"{JAVA_PACKAGE} installed")
+def install_stamp():
+    """
+    Return a digest of the desired state: port, wizard flag and the mtimes
+    of the two files this script manages. Editing either file by hand changes
+    the digest, so drift is never hidden behind a stale stamp.
+    """
+    parts = [JENKINS_PORT, WIZARD_FLAG]
+    for path in (JENKINS_CONFIG, OVERRIDE_FILE):
+        try:
+            parts.append(str(os.stat(path).st_mtime_ns))
+        except OSError:
+            parts.append("-")
+    return hashlib.sha1("|".join(parts).encode()).hexdigest()
+
+def install_is_current():
+    """Return True if the stamp matches the desired state and Jenkins is active."""
+    try:
+        with open(STAMP_FILE) as f:
+            stamp = f.read().strip()
+    except OSError:
+        return False
+    return stamp == install_stamp() and service_is_active(JENKINS_PACKAGE)
 
+# ─── INSTALLATION STEPS ───────────────────────────────────────────────────────
 
 def step_add_jenkins_repo():
-    """Step 3 — Add Jenkins apt repo and GPG key. Idempotent: skips if both exist."""
-    log_step("Step 2/7 — Adding Jenkins apt repository")
-
-    # GPG key — skip only if file exists AND contains the correct key header
-    key_valid = False
-    if os.path.isfile(JENKINS_KEYRING):
-        with open(JENKINS_KEYRING, "rb") as f:
-            header = f.read(50)
-        # Valid ASCII-armored key starts with -----BEGIN PGP PUBLIC KEY BLOCK-----
-        if b"BEGIN PGP PUBLIC KEY BLOCK" in header:
-            key_valid = True
+    """
+    Step 1 — Stage the Jenkins apt repo and GPG key. Idempotent: skips if both exist.
+    Only writes the source files; the package index is refreshed once by the
+    install step so apt metadata is parsed a single time per run.
+    Returns True if the key or repo file was written, so that refresh is forced.
+    """
+    log_step("Step 1/6 — Adding Jenkins apt repository")
 
+    changed = False
+
+    # GPG key — skip only if the keyring's armor decodes and its CRC-24 checksum matches
+    key_valid = _state["key_valid"] if "key_valid" in _state else jenkins_key_valid()
     if key_valid:
         log_skip("Jenkins GPG key already present and valid")
     else:
@@ -164,10 +663,22 @@ def step_add_jenkins_repo():
             log_info("Jenkins GPG key exists but is invalid — reimporting...")
         else:
             log_info("Importing Jenkins GPG key...")
-        run(f"curl -fsSL {JENKINS_KEY_URL} | tee {JENKINS_KEYRING} > /dev/null")
-        os.chmod(JENKINS_KEYRING, 0o644)
-        # Always refresh apt after key change so Jenkins package becomes available
-        run("apt-get update -qq")
+        # Download beside the keyring and verify the armor before swapping it in,
+        # so a truncated or error-page response never replaces a keyring
+        tmp_key = JENKINS_KEY_TMP
+        if not _key_prefetched:
+            download(JENKINS_KEY_URL, tmp_key)
+        with open(tmp_key, "rb") as f:
+            armored = f.read()
+        try:
+            dearmor(armored)
+        except ValueError as e:
+            os.remove(tmp_key)
+            log_error(f"Downloaded Jenkins GPG key is not a valid armored key: {e}")
+            sys.exit(1)
+        os.chmod(tmp_key, 0o644)
+        os.replace(tmp_key, JENKINS_KEYRING)
+        changed = True
         log_ok("GPG key imported")
 
     # Repo entry — skip if already present
@@ -177,173 +688,197 @@ def step_add_jenkins_repo():
         log_info("Adding Jenkins apt source...")
         with open(JENKINS_REPO_FILE, "w") as f:
             f.write(JENKINS_REPO_LINE + "\n")
-        run("apt-get update -qq")
+        changed = True
         log_ok("Jenkins apt repo added")
 
+    return changed
 
-def step_install_jenkins():
-    """Step 4 — Install Jenkins LTS. Idempotent: skips if already installed."""
-    log_step("Step 3/7 — Installing Jenkins LTS")
 
-    if is_package_installed(JENKINS_PACKAGE):
-        log_skip("Jenkins is already installed")
+def step_install_packages(sources_changed):
+    """
+    Step 2 — Install OpenJDK 17 and Jenkins LTS in a single apt transaction.
+    At most one apt-get update and one apt-get install means repo metadata is
+    parsed once and dpkg triggers run once, instead of once per package.
+    Idempotent: only packages not yet installed are passed to apt-get;
+    skips entirely if both are already installed. sources_changed forces the
+    apt-get update even when the lists look fresh.
+    """
+    log_step("Step 2/6 — Installing OpenJDK 17 and Jenkins LTS")
+
+    missing = []
+    for package in REQUIRED_PACKAGES:
+        if is_installed_fast(package):
+            log_skip(f"{package} is already installed")
+        else:
+            missing.append(package)
+    if not missing:
         return
 
-    log_info("Installing Jenkins (this may take a minute)...")
-    run(f"apt-get install -y -qq {JENKINS_PACKAGE}")
-    log_ok("Jenkins installed")
+    apt_update_if_stale(JENKINS_REPO_HOST, force=sources_changed)
+    log_info(f"Installing {' '.join(missing)} (this may take a minute)...")
+    run([apt_installer(), "install", "-y", "-qq", *APT_INSTALL_OPTS, *missing])
+    log_ok(f"{', '.join(missing)} installed")
 
 
 def step_configure_port():
     """
-    Step 4 — Configure Jenkins to listen on port 8000.
+    Step 3 — Configure Jenkins to listen on port 8000.
     Idempotent: only writes if HTTP_PORT is not already set to 8000.
     Satisfies Requirement C — Jenkins JVM itself binds to 8000.
     Returns True if config was changed, False if already correct.
     """
-    log_step(f"Step 4/7 — Configuring Jenkins to listen on port {JENKINS_PORT}")
-
-    target_line  = f"HTTP_PORT={JENKINS_PORT}"
-    default_line = "HTTP_PORT=8080"
+    log_step(f"Step 3/6 — Configuring Jenkins to listen on port {JENKINS_PORT}")
 
     if not os.path.isfile(JENKINS_CONFIG):
         log_error(f"Jenkins config file not found: {JENKINS_CONFIG}")
         sys.exit(1)
 
-    with open(JENKINS_CONFIG, "r") as f:
-        content = f.read()
-
-    # Idempotency check — already set to 8000
-    if target_line in content:
+    if http_port_is_set() or not edit_jenkins_config([set_http_port]):
         log_skip(f"HTTP_PORT is already set to {JENKINS_PORT}")
         return False
 
-    # Replace existing HTTP_PORT line if present, otherwise append
-    if default_line in content:
-        log_info(f"Replacing HTTP_PORT=8080 with HTTP_PORT={JENKINS_PORT}")
-        content = content.replace(default_line, target_line)
-    elif "HTTP_PORT=" in content:
-        import re
-        log_info(f"Replacing existing HTTP_PORT value with {JENKINS_PORT}")
-        content = re.sub(r"HTTP_PORT=\d+", target_line, content)
-    else:
-        log_info(f"Appending HTTP_PORT={JENKINS_PORT} to config")
-        content += f"\n{target_line}\n"
-
-    with open(JENKINS_CONFIG, "w") as f:
-        f.write(content)
-
     log_ok(f"Jenkins configured to listen on port {JENKINS_PORT}")
     return True
 
 
 def step_disable_wizard():
     """
-    Step 5 — Disable the Jenkins setup wizard via systemd drop-in override.
+    Step 4 — Disable the Jenkins setup wizard via systemd drop-in override.
     Newer Jenkins reads JAVA_OPTS from the systemd unit Environment directive,
     not from JAVA_ARGS in /etc/default/jenkins. A drop-in override is used so
     the change survives Jenkins package upgrades without touching the unit file.
     Idempotent: skips if override already contains the wizard disable flag.
     Returns True if config was written, False if already at desired state.
+    The daemon-reload the drop-in needs is deferred to step 5.
     """
-    log_step("Step 5/7 — Disabling Jenkins setup wizard")
+    global _pending_daemon_reload
+    log_step("Step 4/6 — Disabling Jenkins setup wizard")
 
-    wizard_flag   = "-Djenkins.install.runSetupWizard=false"
-    override_dir  = "/etc/systemd/system/jenkins.service.d"
-    override_file = f"{override_dir}/override.conf"
     override_content = (
         "[Service]\n"
-        f'Environment="JAVA_OPTS=-Djava.awt.headless=true {wizard_flag}"\n'
+        f'Environment="JAVA_OPTS=-Djava.awt.headless=true {WIZARD_FLAG}"\n'
         f'Environment="JENKINS_PORT={JENKINS_PORT}"\n'
     )
 
-    # Idempotency check — skip writing if flag already present in override
-    if os.path.isfile(override_file) and file_contains(override_file, wizard_flag) and file_contains(override_file, f"JENKINS_PORT={JENKINS_PORT}"):
+    current = ""
+    if os.path.isfile(OVERRIDE_FILE):
+        with open(OVERRIDE_FILE, "r") as f:
+            current = f.read()
+
+    # Idempotency check — skip writing if flag and exact port already present in override
+    if WIZARD_FLAG in current and _OVERRIDE_PORT_RE.search(current):
+        # File is right — check systemd has actually loaded it
+        if WIZARD_FLAG not in unit_state(JENKINS_PACKAGE).get("Environment", ""):
+            log_info("Override file correct but not loaded by systemd — reloading and restarting...")
+            _pending_daemon_reload = True
+            return True
         # Verify Jenkins is actually listening on the correct port
-        port_check = run(f"ss -tlnp | grep ':{JENKINS_PORT}'", check=False)
-        if port_check.returncode == 0:
+        if jenkins_listening():
             log_skip("Setup wizard already disabled via systemd override")
             return False
-        else:
-            log_info(f"Override file correct but Jenkins not on port {JENKINS_PORT} — reloading and restarting...")
-            run("systemctl daemon-reload")
-            return True
+        log_info(f"Override loaded but Jenkins not on port {JENKINS_PORT} — restarting...")
+        return True
 
     log_info("Writing systemd drop-in override to disable setup wizard...")
-    os.makedirs(override_dir, exist_ok=True)
-    with open(override_file, "w") as f:
-        f.write(override_content)
+    os.makedirs(OVERRIDE_DIR, exist_ok=True)
+    write_atomic(OVERRIDE_FILE, override_content)
 
-    run("systemctl daemon-reload")
+    _pending_daemon_reload = True
     log_ok("Setup wizard disabled via systemd override")
     return True
 
 
 def step_enable_and_restart(restart_required):
     """
-    Step 6 — Enable Jenkins on boot and restart only if needed.
+    Step 5 — Enable Jenkins on boot and restart only if needed.
     restart_required is True only when port or wizard config was not already
     at desired state and was written during this run.
+    A stopped service is enabled and started with one `systemctl enable --now`,
+    or just started when it is already enabled.
+    daemon-reload runs at most once, and only if the wizard step changed the
+    systemd drop-in; /etc/default/jenkins is read by Jenkins on start, so a
+    restart alone applies it.
     """
-    log_step("Step 6/7 — Enabling and starting Jenkins service")
+    log_step("Step 5/6 — Enabling and starting Jenkins service")
+
+    if _pending_daemon_reload:
+        log_info("Reloading systemd to pick up the drop-in override...")
+        run(["systemctl", "daemon-reload"])
+
+    if not service_is_active(JENKINS_PACKAGE):
+        # A stopped service picks up any config change on start — no restart needed
+        if service_is_enabled(JENKINS_PACKAGE):
+            log_info("Jenkins is enabled but not running — starting service...")
+            run(["systemctl", "start", JENKINS_PACKAGE])
+            log_ok("Jenkins started")
+        else:
+            log_info("Jenkins is not running — enabling and starting service...")
+            run(["systemctl", "enable", "--now", JENKINS_PACKAGE])
+            log_ok("Jenkins enabled on boot and started")
+        return
 
     # Enable on boot
     if service_is_enabled(JENKINS_PACKAGE):
         log_skip("Jenkins already enabled on boot")
     else:
         log_info("Enabling Jenkins service...")
-        run("systemctl enable jenkins")
+        run(["systemctl", "enable", JENKINS_PACKAGE])
         log_ok("Jenkins enabled on boot")
 
     # Only restart if desired state was not already met
     if restart_required:
         log_info("Configuration was updated — restarting Jenkins to apply changes...")
-        run("systemctl restart jenkins")
+        run(["systemctl", "restart", JENKINS_PACKAGE])
         log_ok("Jenkins service restarted")
-    elif not service_is_active(JENKINS_PACKAGE):
-        log_info("Jenkins is not running — starting service...")
-        run("systemctl start jenkins")
-        log_ok("Jenkins service started")
     else:
         log_skip("Jenkins already running on port 8000 with correct config — no restart needed")
 
 
 def step_validate():
     """
-    Step 7 — Validate Jenkins is running and responding on port 8000.
-    Polls up to 60 seconds for Jenkins to become ready.
+    Step 6 — Validate Jenkins is running and responding on port 8000.
+    Polls up to 120 seconds for Jenkins to become ready, backing off
+    exponentially (0.25s, 0.5s, 1s, 2s, 4s, then every 5s) so a fast start is
+    detected almost as soon as the port answers. A refused connection keeps
+    the short backoff; an HTTP error means Jenkins is up but still loading,
+    so the next poll waits the full 5s. One keep-alive connection is reused
+    across polls and only reopened after a connection error.
     """
-    log_step(f"Step 7/7 — Validating Jenkins is responding on port {JENKINS_PORT}")
-
-    import time
-    import urllib.request
-    import urllib.error
+    log_step(f"Step 6/6 — Validating Jenkins is responding on port {JENKINS_PORT}")
 
     max_wait  = 120
-    interval  = 5
-    elapsed   = 0
+    interval  = 0.25
+    max_delay = 5
+    start     = time.time()
+    deadline  = start + max_wait
     url       = f"http://localhost:{JENKINS_PORT}"
+    conn      = http.client.HTTPConnection("localhost", int(JENKINS_PORT), timeout=5)
 
     log_info(f"Waiting for Jenkins to respond at {url} (up to {max_wait}s)...")
 
-    while elapsed < max_wait:
+    while time.time() < deadline:
+        elapsed = int(time.time() - start)
         try:
-            req = urllib.request.Request(url)
-            with urllib.request.urlopen(req, timeout=5) as response:
-                code = response.getcode()
-                log_ok(f"Jenkins is UP — HTTP {code} on port {JENKINS_PORT}")
-                return
-        except urllib.error.HTTPError as e:
+            # HEAD — Jenkins answers with headers only, no login page body per poll
+            conn.request("HEAD", "/", headers={"User-Agent": USER_AGENT})
+            response = conn.getresponse()
+            response.read()
+            code = response.status
             # 403 Forbidden is expected — Jenkins is running but auth is required
-            if e.code == 403:
-                log_ok(f"Jenkins is UP — HTTP 403 (auth required) on port {JENKINS_PORT}")
+            if code < 400 or code == 403:
+                conn.close()
+                detail = " (auth required)" if code == 403 else ""
+                log_ok(f"Jenkins is UP — HTTP {code}{detail} on port {JENKINS_PORT}")
                 return
-            log_info(f"HTTP {e.code} — waiting... ({elapsed}s elapsed)")
-        except Exception:
+            log_info(f"HTTP {code} — waiting... ({elapsed}s elapsed)")
+            interval = max_delay
+        except (OSError, http.client.HTTPException):
+            # Refused or dropped — discard the socket; the next request reconnects
+            conn.close()
             log_info(f"Not ready yet — waiting... ({elapsed}s elapsed)")
 
-        time.sleep(interval)
-        elapsed += interval
+        time.sleep(min(interval, max(deadline - time.time(), 0)))
+        interval = min(interval * 2, max_delay)
 
     log_error(f"Jenkins did not respond on port {JENKINS_PORT} within {max_wait} seconds.")
     log_info("Check logs with: sudo journalctl -u jenkins -n 50")
@@ -352,8 +887,7 @@ def step_validate():
 
 # ─── SUMMARY ──────────────────────────────────────────────────────────────────
 
-def log_summary():
-    print(f"""
+SUMMARY_BANNER = f"""
 {Color.BOLD}{Color.GREEN}╔══════════════════════════════════════════════════╗
 ║              Installation Complete               ║
 ╠══════════════════════════════════════════════════╣
@@ -363,24 +897,34 @@ def log_summary():
 ║  Logs:    journalctl -u jenkins -f               ║
 ║  Config:  /etc/default/jenkins                   ║
 ║  Home:    /var/lib/jenkins                       ║
-╚══════════════════════════════════════════════════╝{Color.RESET}
-""")
+╚══════════════════════════════════════════════════╝{Color.RESET}\n
+"""
+
+def log_summary():
+    sys.stdout.write(SUMMARY_BANNER)
 
 
 # ─── MAIN ─────────────────────────────────────────────────────────────────────
 
 def main():
     log_header()
+    for warning in _env_warnings:
+        log_info(warning)
     ensure_root()
+    if install_is_current():
+        log_skip(f"All steps already satisfied — remove {STAMP_FILE} to force a full run")
+        return
     check_ubuntu()
-
-    step_install_java()
-    step_add_jenkins_repo()
-    step_install_jenkins()
-    port_needs_restart   = step_configure_port()
-    wizard_needs_restart = step_disable_wizard()
-    step_enable_and_restart(restart_required=port_needs_restart or wizard_needs_restart)
+    setup_apt_cache()
+    precheck_state()
+
+    sources_changed = step_add_jenkins_repo()
+    step_install_packages(sources_changed)
+    # Run every config step, then restart at most once if any of them changed state
+    changed = any([step_configure_port(), step_disable_wizard()])
+    step_enable_and_restart(restart_required=changed)
     step_validate()
+    write_atomic(STAMP_FILE, install_stamp() + "\n")
 
     log_summary()
 